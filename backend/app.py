@@ -1,15 +1,71 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, stream_template
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from flask_compress import Compress
+import orjson
 import sqlite3
 import os
 import re
+import hashlib
 import secrets
+import atexit
+import functools
+import threading
+import types
+from concurrent.futures import Future, ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
+from cachetools import TTLCache
+from jinja2 import FileSystemBytecodeCache
+from database import DB_PATH, get_conn
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson (jsonify, request.get_json, app.json).
+    Keeps the default provider's sort_keys / debug pretty-print behavior.
+    """
+    def _option(self, sort_keys, indent):
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        option = self._option(kwargs.get("sort_keys", self.sort_keys), kwargs.get("indent"))
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._option(self.sort_keys, pretty))
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
 
 app = Flask(__name__, template_folder="templates", static_folder="../static")
+app.json = OrjsonProvider(app)
+# Emit payloads in insertion order, never indented (even under debug=True)
+app.json.sort_keys = False
+app.json.compact = True
 CORS(app)
 
+# Compress JSON and HTML. Streamed reports are compressed chunk by chunk
+# (br/zstd/deflate only); tiny bodies like errors and 304s are skipped.
+app.config["COMPRESS_MIMETYPES"] = ["application/json", "text/html"]
+app.config["COMPRESS_LEVEL"] = 6
+app.config["COMPRESS_MIN_SIZE"] = 500
+Compress(app)
+
+# Compiled templates survive worker restarts; parsing happens once per deploy.
+# No directory argument: Jinja uses a per-user _jinja2-cache-<uid> dir and
+# checks it is ours with mode 0700 before trusting any bytecode in it.
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+
 # ============================================================
 # DEBUG: confirm which file is running in production
 # ============================================================
@@ -26,8 +82,7 @@ def version():
 # ---------------------------
 # SQLite (legacy token support ONLY)
 # ---------------------------
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "Customer_Data.db")
+# DB_PATH comes from database.py (shared with the maintenance scripts)
 
 PUBLIC_BASE_URL = os.environ.get("PUBLIC_BASE_URL", "").strip().rstrip("/")
 if not PUBLIC_BASE_URL:
@@ -41,47 +96,104 @@ SUPABASE_URL = (os.environ.get("SUPABASE_URL") or "").rstrip("/")
 SUPABASE_SERVICE_ROLE_KEY = (os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or "").strip()
 LEGACY_TABLE = os.environ.get("LEGACY_TABLE", "customer_data_legacy").strip()
 
-def supabase_headers():
-    return {
-        "apikey": SUPABASE_SERVICE_ROLE_KEY,
-        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
+# Admin routes are disabled unless this is set (sent as "Authorization: Bearer <token>")
+ADMIN_TOKEN = (os.environ.get("ADMIN_TOKEN") or "").strip()
+
+# Key material is fixed for the process lifetime; build the headers once,
+# read-only so no call site can mutate the shared mapping.
+SUPABASE_HEADERS = types.MappingProxyType({
+    "apikey": SUPABASE_SERVICE_ROLE_KEY,
+    "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+    "Content-Type": "application/json",
+    "Accept": "application/json",
+})
+
+# Env is read once at import, so readiness is fixed for the process too.
+SUPABASE_READY = USE_SUPABASE and bool(SUPABASE_URL) and bool(SUPABASE_SERVICE_ROLE_KEY)
 
 def supabase_ready():
-    return USE_SUPABASE and bool(SUPABASE_URL) and bool(SUPABASE_SERVICE_ROLE_KEY)
+    return SUPABASE_READY
+
+# One pooled session for every PostgREST call: keeps the TCP/TLS connection
+# to Supabase alive across requests instead of handshaking per call.
+_SB_SESSION = requests.Session()
+# pool_maxsize covers request threads plus the _sb_pool fan-out workers.
+_SB_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=2, read=0, backoff_factor=0.2, status_forcelist=[502, 503, 504]),
+))
+_SB_SESSION.headers.update(SUPABASE_HEADERS)
+_SB_SESSION.headers["Connection"] = "keep-alive"
+# Fail fast on an unreachable host; the read timeout stays per call.
+SB_CONNECT_TIMEOUT = 3
 
 # ---------------------------
 # Helpers
 # ---------------------------
+_db_local = threading.local()
+_db_conns = []
+_db_conns_lock = threading.Lock()
+
 def get_db():
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
+    """
+    One long-lived connection per worker thread (WAL + autocommit reads).
+    Opened lazily on first use and only closed at interpreter shutdown.
+    """
+    con = getattr(_db_local, "con", None)
+    if con is None:
+        con = get_conn(check_same_thread=False, isolation_level=None)
+        _db_local.con = con
+        with _db_conns_lock:
+            _db_conns.append(con)
     return con
 
+@atexit.register
+def _close_dbs():
+    with _db_conns_lock:
+        while _db_conns:
+            _db_conns.pop().close()
+
+# Routes normalize once at the boundary; every VIN-keyed helper below
+# (sb_*, *_sqlite, profile cache) expects an already-normalized VIN.
 def normalize_vin(vin: str) -> str:
     return (vin or "").strip().upper()
 
+# 17 chars, no I/O/Q
+_VIN_RE = re.compile(r"[A-HJ-NPR-Z0-9]{17}")
+
+def is_valid_vin(vin: str) -> bool:
+    return _VIN_RE.fullmatch(vin) is not None
+
 def normalize_token(token: str) -> str:
     return (token or "").strip().lower()
 
+# Folder links are stable per vehicle and every report render parses one.
+@functools.lru_cache(maxsize=4096)
 def drive_embed_from_folder(url):
     if not url:
         return None
-    m = re.search(r"/folders/([a-zA-Z0-9_\-]+)", str(url))
-    if not m:
+    _, sep, tail = str(url).partition("/folders/")
+    if not sep:
+        return None
+    fid = tail.split("/", 1)[0].split("?", 1)[0].split("#", 1)[0]
+    # Drive folder IDs are [A-Za-z0-9_-]
+    if not fid or not (fid.isascii() and fid.replace("_", "").replace("-", "").isalnum()):
         return None
-    fid = m.group(1)
     return f"https://drive.google.com/embeddedfolderview?id={fid}#grid"
 
+# M/D/YYYY without zero padding ('#' on Windows, '-' elsewhere)
+DATE_FMT = "%#m/%#d/%Y" if os.name == "nt" else "%-m/%-d/%Y"
+
 def fmt_date(iso_str: str) -> str:
     if not iso_str:
         return ""
     try:
-        s = str(iso_str).replace("Z", "+00:00")
+        s = str(iso_str)
+        if s.endswith("Z"):
+            s = s[:-1] + "+00:00"
         dt = datetime.fromisoformat(s)
-        return dt.strftime("%#m/%#d/%Y") if os.name == "nt" else dt.strftime("%-m/%-d/%Y")
+        return dt.strftime(DATE_FMT)
     except Exception:
         return str(iso_str)
 
@@ -94,103 +206,230 @@ def first_truthy(*vals):
             return s
     return ""
 
+class SupabaseError(RuntimeError):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+# Shared worker pool for fanning out independent Supabase calls within one
+# request. Tasks submitted here must not submit to the pool themselves.
+_sb_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="sb")
+
 def sb_get(path: str, params: dict, timeout: int = 20):
     """
     Generic Supabase REST GET (PostgREST).
-    Raises on non-200.
+    Raises SupabaseError on non-200.
     """
     url = f"{SUPABASE_URL}/rest/v1/{path.lstrip('/')}"
-    r = requests.get(url, headers=supabase_headers(), params=params, timeout=timeout)
+    r = _SB_SESSION.get(url, params=params, timeout=(SB_CONNECT_TIMEOUT, timeout))
     if r.status_code != 200:
-        raise RuntimeError(f"Supabase GET {path} failed: {r.status_code} {r.text}")
-    return r.json() or []
+        raise SupabaseError(f"Supabase GET {path} failed: {r.status_code} {r.text}", r.status_code)
+    if not r.content:
+        return []
+    return orjson.loads(r.content) or []
 
 # ============================================================
 # SQLITE (legacy token route fallback)
 # ============================================================
+# Module-level SQL so the text is byte-identical on every call and hits the
+# connection's prepared-statement cache.
+# Only what the public report reads; phone/address/zip are never shown there.
+VEHICLE_COLUMNS = "customer_id, vin_number, make, model, year, status, notes, service_history_link, access_token"
+VEHICLE_KEYS = tuple(c.strip() for c in VEHICLE_COLUMNS.split(","))
+
+SQL_VEHICLE_BY_TOKEN = f"""
+    SELECT {VEHICLE_COLUMNS}
+    FROM Customer_Data
+    WHERE LOWER(TRIM(access_token)) = ?
+    LIMIT 1
+"""
+
+# Result column order of SQL_SERVICE_HISTORY_BY_VIN (same shape as build_history_from_jobs)
+HISTORY_KEYS = (
+    "date", "service_type", "service_notes", "next_recommended_service",
+    "photos_link", "technician", "price", "customer_feedback",
+)
+
+SQL_SERVICE_HISTORY_BY_VIN = """
+    SELECT
+      COALESCE(date, '')                     AS date,
+      COALESCE(service_type, '')             AS service_type,
+      COALESCE(service_notes, '')            AS service_notes,
+      COALESCE(next_recommended_service, '') AS next_recommended_service,
+      COALESCE(photos_link, '')              AS photos_link,
+      COALESCE(technician, '')               AS technician,
+      COALESCE(price, '')                    AS price,
+      COALESCE(customer_feedback, '')        AS customer_feedback
+    FROM Service_History
+    WHERE UPPER(TRIM(vehicle_vin)) = ?
+    ORDER BY Service_History.date DESC
+"""
+
+# table name -> set of column names; filled by init_schema() at import and
+# by POST /admin/schema/refresh after a migration
+_SCHEMA = {}
+
+def init_schema():
+    """
+    Snapshot the SQLite schema. It only changes with a migration, so the
+    table/column probes below answer from memory instead of querying
+    sqlite_master / PRAGMA table_info on every request.
+    """
+    global _SCHEMA
+    schema = {}
+    if os.path.exists(DB_PATH):
+        con = sqlite3.connect(DB_PATH)
+        try:
+            tables = [r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+            for name in tables:
+                schema[name] = {row[1] for row in con.execute(f"PRAGMA table_info({name})")}
+        finally:
+            con.close()
+    # swap, don't mutate, so concurrent readers never see a half-built dict
+    _SCHEMA = schema
+
+def table_exists(table_name):
+    return table_name in _SCHEMA
+
 def column_exists(table_name, column_name):
-    con = get_db()
-    cur = con.cursor()
-    try:
-        cur.execute(f"PRAGMA table_info({table_name})")
-        cols = [row[1] for row in cur.fetchall()]
-        return column_name in cols
-    finally:
-        con.close()
+    return column_name in _SCHEMA.get(table_name, ())
 
 def get_vehicle_by_token_sqlite(token):
     token = normalize_token(token)
     if not column_exists("Customer_Data", "access_token"):
         return None
-    con = get_db()
-    cur = con.cursor()
-    cur.execute(
-        """
-        SELECT *
-        FROM Customer_Data
-        WHERE LOWER(TRIM(access_token)) = ?
-        LIMIT 1
-        """,
-        (token,),
-    )
-    r = cur.fetchone()
-    con.close()
-    return dict(r) if r else None
+    r = get_db().execute(SQL_VEHICLE_BY_TOKEN, (token,)).fetchone()
+    return dict(zip(VEHICLE_KEYS, r)) if r else None
 
 def get_service_history_for_vin_sqlite(vin):
     # Optional: if you still have Service_History in SQLite
-    con = get_db()
-    cur = con.cursor()
+    if not table_exists("Service_History"):
+        return []
+    rows = get_db().execute(SQL_SERVICE_HISTORY_BY_VIN, (vin,)).fetchall()
+    return [dict(zip(HISTORY_KEYS, r)) for r in rows]
+
+# Expression indexes matching the WHERE clauses above, so VIN/token lookups
+# are B-tree probes instead of full scans. The Service_History index also
+# covers the ORDER BY date DESC.
+SQLITE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_customer_vin_upper ON Customer_Data(UPPER(TRIM(vin_number)))",
+    "CREATE INDEX IF NOT EXISTS idx_customer_token_lower ON Customer_Data(LOWER(TRIM(access_token)))",
+    "CREATE INDEX IF NOT EXISTS idx_service_vin_upper_date ON Service_History(UPPER(TRIM(vehicle_vin)), date DESC)",
+]
+
+def ensure_sqlite_indexes():
+    """
+    One-time startup migration. Skips tables/columns that don't exist and
+    never blocks startup (e.g. read-only filesystem).
+    """
+    if not os.path.exists(DB_PATH):
+        return
+    con = sqlite3.connect(DB_PATH)
     try:
-        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='Service_History'")
-        if not cur.fetchone():
-            return []
-        cur.execute(
-            """
-            SELECT
-              COALESCE(date, '')                     AS date,
-              COALESCE(service_type, '')             AS service_type,
-              COALESCE(service_notes, '')            AS service_notes,
-              COALESCE(next_recommended_service, '') AS next_recommended_service,
-              COALESCE(photos_link, '')              AS photos_link,
-              COALESCE(technician, '')               AS technician,
-              COALESCE(price, '')                    AS price,
-              COALESCE(customer_feedback, '')        AS customer_feedback
-            FROM Service_History
-            WHERE UPPER(TRIM(vehicle_vin)) = ?
-            ORDER BY date DESC
-            """,
-            (normalize_vin(vin),),
-        )
-        return [dict(r) for r in cur.fetchall()]
+        for stmt in SQLITE_INDEXES:
+            try:
+                con.execute(stmt)
+            except sqlite3.OperationalError:
+                # missing table/column on older DB files
+                continue
+        con.commit()
+    except sqlite3.Error:
+        pass
     finally:
         con.close()
 
+ensure_sqlite_indexes()
+init_schema()
+
 # ============================================================
 # SUPABASE: vehicles + customer_data_legacy merge
 # ============================================================
+VEHICLE_SELECT = "id,vin,year,make,model,trim,color,notes,nickname,service_history_link,access_token,status"
+
 def sb_vehicle_by_vin(vin: str):
     """
     public.vehicles has column: vin (text)
     Use eq (exact match) because we normalize to uppercase.
     """
-    vin = normalize_vin(vin)
     rows = sb_get("vehicles", {
-        "select": "id,vin,year,make,model,trim,color,notes,nickname,service_history_link,access_token,status",
+        "select": VEHICLE_SELECT,
         "vin": f"eq.{vin}",
         "limit": "1",
     })
     return rows[0] if rows else None
 
+# Columns merge_profile / search_payload read from the legacy table.
+LEGACY_SELECT = (
+    "vin,customer_id,customer_name,phone_number,email,address,zip_code,"
+    "vehicle_nickname,make,model,year,status,notes,service_history_link"
+)
+
+# LEGACY_TABLE is configurable, so a deployment's table may lack one of the
+# columns above; the first 400 flips this off and we go back to select=*.
+_PROJECT_LEGACY = True
+
+def sb_legacy_rows(vin_filter: str, limit=None):
+    global _PROJECT_LEGACY
+    params = {"vin": vin_filter}
+    if limit:
+        params["limit"] = str(limit)
+    if _PROJECT_LEGACY:
+        try:
+            return sb_get(LEGACY_TABLE, {"select": LEGACY_SELECT, **params})
+        except SupabaseError as e:
+            if e.status_code != 400:
+                raise
+            _PROJECT_LEGACY = False
+    return sb_get(LEGACY_TABLE, {"select": "*", **params})
+
 def sb_legacy_by_vin(vin: str):
-    vin = normalize_vin(vin)
-    rows = sb_get(LEGACY_TABLE, {
-        "select": "*",
-        "vin": f"eq.{vin}",
-        "limit": "1",
-    })
+    rows = sb_legacy_rows(f"eq.{vin}", limit=1)
     return rows[0] if rows else None
 
+def rows_by_vin(rows):
+    """
+    Index PostgREST rows by normalized vin (first row wins, like limit=1).
+    """
+    out = {}
+    for row in rows:
+        out.setdefault(normalize_vin(row.get("vin")), row)
+    return out
+
+# Values per in.(...) filter in batch lookups: keeps each request line well
+# under common 8 KB limits and each response well under PostgREST's max-rows.
+IN_FILTER_CHUNK = 50
+
+def chunked(items, size=IN_FILTER_CHUNK):
+    """
+    Split a list into consecutive slices of at most `size` items.
+    """
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def sb_vehicles_by_vins(vins, embed_jobs: bool = False):
+    """
+    Batch form of sb_vehicle_by_vin: one in.(...) request per
+    IN_FILTER_CHUNK VINs -> {VIN: row}.
+    embed_jobs=True also returns each vehicle's newest HISTORY_LIMIT jobs
+    (job_services and customers embedded) as row["jobs"]. jobs.limit is
+    applied per vehicle, so one long history can't crowd out the others.
+    """
+    params = {"select": VEHICLE_SELECT}
+    if embed_jobs:
+        params = {
+            "select": f"{VEHICLE_SELECT},jobs({JOBS_SELECT},{JOB_SERVICES_EMBED},{JOB_CUSTOMER_EMBED})",
+            "jobs.order": "performed_at.desc",
+            "jobs.limit": str(HISTORY_LIMIT),
+        }
+    rows = []
+    for chunk in chunked(vins):
+        rows += sb_get("vehicles", {**params, "vin": f"in.({','.join(chunk)})"})
+    return rows_by_vin(rows)
+
+def sb_legacy_by_vins(vins):
+    rows = []
+    for chunk in chunked(vins):
+        rows += sb_legacy_rows(f"in.({','.join(chunk)})")
+    return rows_by_vin(rows)
 
 def sb_latest_job_for_vehicle(vehicle_id: str):
     """
@@ -217,57 +456,157 @@ def sb_customer_by_id(customer_id: str):
     })
     return rows[0] if rows else None
 
-def sb_jobs_by_vehicle(vehicle_id: str, limit: int = 25):
+JOB_CUSTOMER_EMBED = "customers(id,full_name,phone,phone_norm)"
+
+# Flips to False the first time PostgREST rejects the jobs -> customers embed
+# (400: relationship not registered); from then on use the two plain lookups.
+_EMBED_JOB_CUSTOMER = True
+
+def sb_latest_customer_for_vehicle(vehicle_id: str):
+    """
+    Customer on the vehicle's latest job (if any). The job and its customer
+    come back in one PostgREST round-trip via an embedded resource.
+    """
+    global _EMBED_JOB_CUSTOMER
+    if _EMBED_JOB_CUSTOMER:
+        try:
+            rows = sb_get("jobs", {
+                "select": f"id,performed_at,customer_id,{JOB_CUSTOMER_EMBED}",
+                "vehicle_id": f"eq.{vehicle_id}",
+                "order": "performed_at.desc",
+                "limit": "1",
+            })
+            return (rows[0].get("customers") if rows else None) or None
+        except SupabaseError as e:
+            if e.status_code != 400:
+                raise
+            _EMBED_JOB_CUSTOMER = False
+
+    latest_job = sb_latest_job_for_vehicle(vehicle_id)
+    if latest_job and latest_job.get("customer_id"):
+        return sb_customer_by_id(latest_job["customer_id"])
+    return None
+
+JOBS_SELECT = "id,performed_at,notes,total_price_cents,vehicle_id,customer_id"
+JOB_SERVICES_EMBED = "job_services(service_id,services(name))"
+
+# Same fallback idea as _EMBED_JOB_CUSTOMER, for the jobs -> job_services embed.
+_EMBED_JOB_SERVICES = True
+
+def sb_jobs_by_vehicle(vehicle_id: str, limit: int = 25, embed: bool = True):
     """
     public.jobs - keep minimal columns; safe against schema differences.
+    embed=True also returns each job's job_services(...services) rows, so
+    history needs one request instead of one per job.
     If RLS blocks jobs, caller should handle exception.
     """
+    select = JOBS_SELECT
+    if embed:
+        select = f"{select},{JOB_SERVICES_EMBED}"
     rows = sb_get("jobs", {
-        "select": "id,performed_at,notes,total_price_cents,vehicle_id,customer_id",
+        "select": select,
         "vehicle_id": f"eq.{vehicle_id}",
         "order": "performed_at.desc",
         "limit": str(limit),
     })
     return rows
 
-def sb_job_services(job_id: str):
+# And again for the vehicles -> jobs embed that batch lookups use.
+_EMBED_VEHICLE_JOBS = True
+
+def sb_vehicles_with_jobs_by_vins(vins):
     """
-    public.job_services join services - if blocked by RLS, return empty list.
+    sb_vehicles_by_vins with each vehicle's jobs embedded while PostgREST
+    accepts that; after a 400, plain vehicle rows (no "jobs" key).
+    """
+    global _EMBED_VEHICLE_JOBS
+    if _EMBED_VEHICLE_JOBS and _EMBED_JOB_SERVICES and _EMBED_JOB_CUSTOMER:
+        try:
+            return sb_vehicles_by_vins(vins, embed_jobs=True)
+        except SupabaseError as e:
+            if e.status_code != 400:
+                raise
+            _EMBED_VEHICLE_JOBS = False
+    return sb_vehicles_by_vins(vins)
+
+def sb_job_services_for_jobs(job_ids):
     """
+    public.job_services join services for many jobs in one in.(...) request,
+    grouped as {job_id: [rows]} - if blocked by RLS, return empty dict.
+    """
+    job_ids = [str(i) for i in job_ids if i]
+    if not job_ids:
+        return {}
     url = f"{SUPABASE_URL}/rest/v1/job_services"
     params = {
-        "select": "service_id,services(name,category)",
-        "job_id": f"eq.{job_id}",
+        "select": "job_id,service_id,services(name)",
+        "job_id": f"in.({','.join(job_ids)})",
     }
-    r = requests.get(url, headers=supabase_headers(), params=params, timeout=20)
-    if r.status_code != 200:
-        return []
-    return r.json() or []
+    r = _SB_SESSION.get(url, params=params, timeout=(SB_CONNECT_TIMEOUT, 20))
+    if r.status_code != 200 or not r.content:
+        return {}
+    by_job = {}
+    for row in orjson.loads(r.content) or []:
+        by_job.setdefault(str(row.get("job_id")), []).append(row)
+    return by_job
+
+def service_label_for(job_services_rows) -> str:
+    """
+    "First (+N)" label from job_services rows; blank names are skipped.
+    """
+    first = None
+    extra = 0
+    for row in job_services_rows:
+        nm = ((row.get("services") or {}).get("name") or "").strip()
+        if not nm:
+            continue
+        if first is None:
+            first = nm
+        else:
+            extra += 1
+    if first is None:
+        return ""
+    return f"{first} (+{extra})" if extra else first
+
+# Most recent jobs shown per vehicle
+HISTORY_LIMIT = 25
 
-def build_history_from_jobs(vehicle_id: str):
+def build_history_from_jobs(vehicle_id: str, jobs=None):
     """
     Return service_history[] in your expected shape using jobs + job_services + services.
+    jobs: rows a batch lookup already fetched (job_services embedded).
     """
+    global _EMBED_JOB_SERVICES
     out = []
     try:
-        jobs = sb_jobs_by_vehicle(vehicle_id, limit=25)
+        if jobs is None and _EMBED_JOB_SERVICES:
+            try:
+                jobs = sb_jobs_by_vehicle(vehicle_id, limit=HISTORY_LIMIT)
+            except SupabaseError as e:
+                if e.status_code != 400:
+                    raise
+                _EMBED_JOB_SERVICES = False
+        if jobs is None:
+            jobs = sb_jobs_by_vehicle(vehicle_id, limit=HISTORY_LIMIT, embed=False)
     except Exception:
         return out
 
+    # Embed rejected: fetch every job's services in one batched request
+    services_by_job = {}
+    if jobs and "job_services" not in jobs[0]:
+        try:
+            services_by_job = sb_job_services_for_jobs([j.get("id") for j in jobs])
+        except Exception:
+            services_by_job = {}
+
     for j in jobs:
         service_label = ""
         try:
-            js = sb_job_services(j.get("id"))
-            names = []
-            for row in js:
-                s = row.get("services") or {}
-                nm = (s.get("name") or "").strip()
-                if nm:
-                    names.append(nm)
-            if names:
-                service_label = names[0]
-                if len(names) > 1:
-                    service_label = f"{names[0]} (+{len(names)-1})"
+            if "job_services" in j:
+                js = j.get("job_services") or []
+            else:
+                js = services_by_job.get(str(j.get("id")), [])
+            service_label = service_label_for(js)
         except Exception:
             service_label = ""
 
@@ -283,67 +622,74 @@ def build_history_from_jobs(vehicle_id: str):
         })
     return out
 
-def merged_profile_by_vin(vin: str):
+def latest_customer_or_none(vehicle_id: str):
+    try:
+        return sb_latest_customer_for_vehicle(vehicle_id)
+    except Exception:
+        return None
+
+def start_vehicle_fetches(veh):
+    """
+    Start the vehicle_id-keyed lookups (latest customer, job history) on
+    _sb_pool. Returns (customer_future, history_future), or (None, None)
+    when there is no vehicles row.
+    """
+    if not (veh and veh.get("id")):
+        return None, None
+    return (
+        _sb_pool.submit(latest_customer_or_none, veh["id"]),
+        _sb_pool.submit(build_history_from_jobs, veh["id"]),
+    )
+
+def vehicle_extras(veh):
+    """
+    (latest_customer, service_history) for a batch-fetched vehicles row, in
+    the caller's thread. Uses the row's embedded jobs when present (and
+    drops them from the row); otherwise runs the per-vehicle lookups here
+    rather than queueing them on _sb_pool.
+    """
+    if not (veh and veh.get("id")):
+        return None, []
+    jobs = veh.pop("jobs", None)
+    if jobs is None:
+        return latest_customer_or_none(veh["id"]), build_history_from_jobs(veh["id"])
+    customer = (jobs[0].get("customers") if jobs else None) or None
+    return customer, build_history_from_jobs(veh["id"], jobs=jobs)
+
+def merge_profile(vin: str, veh, legacy, latest_customer, service_history):
     """
     Merge record from:
       - vehicles (authoritative for VIN + core vehicle)
       - customer_data_legacy (authoritative for customer info + drive folder link)
       - NEW: latest job + customers fallback (for modern data)
     """
-    vin = normalize_vin(vin)
+    # Resolve the optional rows once instead of re-evaluating `x or {}` per field.
+    # first_truthy stays where its strip()/str() normalization matters.
+    veh = veh or {}
+    legacy = legacy or {}
+    latest_customer = latest_customer or {}
 
-    veh = sb_vehicle_by_vin(vin)
-    legacy = sb_legacy_by_vin(vin)
-
-    if not veh and not legacy:
-        return None
+    make = first_truthy(veh.get("make"), legacy.get("make"))
+    model = first_truthy(veh.get("model"), legacy.get("model"))
+    year = veh.get("year") or legacy.get("year") or ""
 
-    make = first_truthy((veh or {}).get("make"), (legacy or {}).get("make"))
-    model = first_truthy((veh or {}).get("model"), (legacy or {}).get("model"))
-    year = (veh or {}).get("year") or (legacy or {}).get("year") or ""
-
-    vehicle_nickname = first_truthy((legacy or {}).get("vehicle_nickname"), (veh or {}).get("nickname"), "")
+    vehicle_nickname = first_truthy(legacy.get("vehicle_nickname"), veh.get("nickname"))
 
     # Drive folder link: legacy first, then vehicles
-    service_history_link = first_truthy(
-        (legacy or {}).get("service_history_link"),
-        (veh or {}).get("service_history_link"),
-        ""
-    )
-
-    status = first_truthy((legacy or {}).get("status"), (veh or {}).get("status"), "")
-    notes = first_truthy((legacy or {}).get("notes"), (veh or {}).get("notes"), "")
+    service_history_link = first_truthy(legacy.get("service_history_link"), veh.get("service_history_link"))
 
-        # --- NEW: Pull customer fields (legacy primary) ---
-    customer_name = first_truthy((legacy or {}).get("customer_name"), "")
-    phone_number = first_truthy((legacy or {}).get("phone_number"), "")
-    email = first_truthy((legacy or {}).get("email"), "")
+    status = first_truthy(legacy.get("status"), veh.get("status"))
+    notes = first_truthy(legacy.get("notes"), veh.get("notes"))
 
-
-    latest_customer = None
-    if veh and veh.get("id"):
-        try:
-            latest_job = sb_latest_job_for_vehicle(veh["id"])
-            if latest_job and latest_job.get("customer_id"):
-                latest_customer = sb_customer_by_id(latest_job["customer_id"])
-        except Exception:
-            latest_customer = None
-
-    # fallback from modern customers table
-    if not customer_name and latest_customer:
-        customer_name = first_truthy(latest_customer.get("full_name"), "")
-    if not phone_number and latest_customer:
-        phone_number = first_truthy(latest_customer.get("phone"), "")
-
-    # Service history from jobs requires vehicle_id
-    service_history = []
-    if veh and veh.get("id"):
-        service_history = build_history_from_jobs(veh["id"])
+    # Customer fields: legacy primary, modern customers table as fallback
+    customer_name = first_truthy(legacy.get("customer_name"), latest_customer.get("full_name"))
+    phone_number = first_truthy(legacy.get("phone_number"), latest_customer.get("phone"))
+    email = first_truthy(legacy.get("email"))
 
     return {
-        "veh": veh or {},
-        "legacy": legacy or {},
-        "latest_customer": latest_customer or {},
+        "veh": veh,
+        "legacy": legacy,
+        "latest_customer": latest_customer,
         "merged": {
             "vin": vin,
             "make": make,
@@ -356,13 +702,188 @@ def merged_profile_by_vin(vin: str):
             "phone_number": phone_number or "",
             "email": email or "",
             "service_history_link": service_history_link,
-            "service_history": service_history,
+            "service_history": service_history or [],
         }
     }
 
+def fetch_merged_profile_by_vin(vin: str):
+    """
+    Uncached merge (always hits Supabase). See merge_profile for the sources.
+    """
+    # Independent lookups: pay one round-trip of latency instead of two
+    f_veh = _sb_pool.submit(sb_vehicle_by_vin, vin)
+    f_legacy = _sb_pool.submit(sb_legacy_by_vin, vin)
+    veh = f_veh.result()
+    legacy = f_legacy.result()
+
+    if not veh and not legacy:
+        return None
+
+    f_customer, f_history = start_vehicle_fetches(veh)
+    return merge_profile(
+        vin, veh, legacy,
+        f_customer.result() if f_customer else None,
+        f_history.result() if f_history else [],
+    )
+
+def fetch_merged_profiles_by_vins(vins):
+    """
+    Batch form of fetch_merged_profile_by_vin for already-normalized VINs:
+    one vehicles request (each vehicle's newest jobs embedded) and one
+    legacy request per IN_FILTER_CHUNK VINs.
+    Returns {VIN: profile or None}.
+    """
+    if not vins:
+        return {}
+
+    f_veh = _sb_pool.submit(sb_vehicles_with_jobs_by_vins, vins)
+    f_legacy = _sb_pool.submit(sb_legacy_by_vins, vins)
+    vehicles = f_veh.result()
+    legacies = f_legacy.result()
+
+    out = {}
+    for vin in vins:
+        veh, legacy = vehicles.get(vin), legacies.get(vin)
+        if not veh and not legacy:
+            out[vin] = None
+            continue
+        customer, history = vehicle_extras(veh)
+        out[vin] = merge_profile(vin, veh, legacy, customer, history)
+    return out
+
+# VIN -> merged profile. VIN data changes rarely, so a short TTL keeps
+# repeat /search and /vin/<VIN> hits off Supabase entirely.
+PROFILE_CACHE_TTL = 60
+_profile_cache = TTLCache(maxsize=2048, ttl=PROFILE_CACHE_TTL)
+# VIN -> Future for fetches currently in flight; concurrent misses for the
+# same VIN wait on the first one instead of hitting Supabase again.
+_profile_inflight = {}
+# VINs that just came back "not found": barcode scanners retry the same bad
+# VIN in a tight loop, so remember misses briefly to skip the round-trips.
+NOT_FOUND_CACHE_TTL = 10
+_profile_missing = TTLCache(maxsize=2048, ttl=NOT_FOUND_CACHE_TTL)
+_profile_cache_lock = threading.Lock()
+
+def clear_profile_cache():
+    """
+    Drop every cached profile. Call this from any endpoint that writes
+    vehicle/customer data.
+    """
+    with _profile_cache_lock:
+        _profile_cache.clear()
+        _profile_missing.clear()
+
+def invalidate_profile(vin: str) -> bool:
+    """
+    Drop one VIN's cached profile (staff edits). Returns True if it was cached.
+    """
+    with _profile_cache_lock:
+        _profile_missing.pop(vin, None)
+        return _profile_cache.pop(vin, None) is not None
+
+def merged_profile_by_vin(vin: str):
+    """
+    Cached wrapper around fetch_merged_profile_by_vin (None results are
+    remembered for NOT_FOUND_CACHE_TTL only).
+    Concurrent misses for one VIN share a single fetch; its result (or
+    exception) fans out to every waiter.
+    """
+    with _profile_cache_lock:
+        hit = _profile_cache.get(vin)
+        if hit is not None:
+            return hit
+        if vin in _profile_missing:
+            return None
+        fut = _profile_inflight.get(vin)
+        leader = fut is None
+        if leader:
+            fut = _profile_inflight[vin] = Future()
+
+    if not leader:
+        return fut.result()
+
+    try:
+        data = fetch_merged_profile_by_vin(vin)
+    except BaseException as e:
+        with _profile_cache_lock:
+            _profile_inflight.pop(vin, None)
+        fut.set_exception(e)
+        raise
+
+    with _profile_cache_lock:
+        if data is not None:
+            _profile_cache[vin] = data
+        else:
+            _profile_missing[vin] = True
+        _profile_inflight.pop(vin, None)
+    fut.set_result(data)
+    return data
+
+def merged_profiles_by_vins(vins):
+    """
+    Cached batch lookup: serves hits from the profile cache and fetches all
+    misses in one batch. Returns {VIN: profile or None}.
+    """
+    out = {}
+    with _profile_cache_lock:
+        for vin in vins:
+            hit = _profile_cache.get(vin)
+            if hit is not None or vin in _profile_missing:
+                out[vin] = hit
+
+    misses = [vin for vin in vins if vin not in out]
+    fetched = fetch_merged_profiles_by_vins(misses)
+    with _profile_cache_lock:
+        for vin, data in fetched.items():
+            if data is not None:
+                _profile_cache[vin] = data
+            else:
+                _profile_missing[vin] = True
+    out.update(fetched)
+    return out
+
+# ---------------------------
+# HTTP caching (ETag / Cache-Control)
+# ---------------------------
+SEARCH_CACHE_CONTROL = "private, max-age=60, stale-while-revalidate=300"
+PUBLIC_REPORT_CACHE_CONTROL = "public, max-age=30"
+
+def payload_etag(obj) -> str:
+    """
+    Short content hash of a JSON-serializable payload.
+    """
+    raw = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+def with_cache_headers(resp, etag, cache_control):
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = cache_control
+    return resp
+
+def not_modified(etag, cache_control):
+    """
+    304 response if the client already holds this ETag, else None.
+    Checked before serializing/rendering so repeat views skip that work.
+    Flask-Compress sends compressed bodies as "<etag>:<encoding>", so that
+    form counts as a match too (and is echoed back unchanged).
+    """
+    inm = request.if_none_match
+    if inm.star_tag:
+        held = etag
+    else:
+        held = next((t for t in inm if t == etag or t.startswith(f"{etag}:")), None)
+    if held is None:
+        return None
+    return with_cache_headers(app.response_class(status=304), held, cache_control)
+
 # ============================================================
 # Routes
 # ============================================================
+def admin_authorized():
+    if not ADMIN_TOKEN:
+        return False
+    return secrets.compare_digest(request.headers.get("Authorization", ""), f"Bearer {ADMIN_TOKEN}")
+
 @app.route("/health")
 def health():
     return jsonify({
@@ -386,29 +907,83 @@ def health_supabase():
 def debug_supabase_vehicle(vin):
     if not supabase_ready():
         return jsonify({"ok": False, "error": "Supabase not ready"}), 500
+    vin = normalize_vin(vin)
     try:
-        veh = sb_vehicle_by_vin(vin)
-        legacy = sb_legacy_by_vin(vin)
-        merged = merged_profile_by_vin(vin)
+        # One uncached fetch; its raw rows are the debug view
+        data = fetch_merged_profile_by_vin(vin) or {}
+        veh = data.get("veh") or None
+        legacy = data.get("legacy") or None
         return jsonify({
             "ok": bool(veh or legacy),
-            "vin": normalize_vin(vin),
+            "vin": vin,
             "vehicles_row": veh,
             "legacy_row": legacy,
-            "merged": (merged or {}).get("merged") if merged else None
+            "merged": data.get("merged")
         }), (200 if (veh or legacy) else 404)
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
 
+@app.route("/admin/cache/invalidate/<vin>", methods=["POST"])
+def admin_invalidate_vin(vin):
+    if not admin_authorized():
+        return jsonify({"ok": False, "error": "Unauthorized"}), 401
+    vin = normalize_vin(vin)
+    return jsonify({"ok": True, "vin": vin, "invalidated": invalidate_profile(vin)})
+
+@app.route("/admin/cache/flush", methods=["POST"])
+def admin_flush_cache():
+    if not admin_authorized():
+        return jsonify({"ok": False, "error": "Unauthorized"}), 401
+    clear_profile_cache()
+    return jsonify({"ok": True})
+
+@app.route("/admin/schema/refresh", methods=["POST"])
+def admin_refresh_schema():
+    if not admin_authorized():
+        return jsonify({"ok": False, "error": "Unauthorized"}), 401
+    init_schema()
+    return jsonify({"ok": True, "tables": sorted(_SCHEMA)})
+
 @app.route("/")
 def home():
     return render_template("index.html")
 
+def search_payload(vin: str, data):
+    """
+    Dashboard JSON for one merged profile (/search and /vins).
+    """
+    m = data["merged"]
+    legacy = data["legacy"]
+
+    # Dashboard should populate like your original (includes customer fields + drive gallery)
+    # If you want to hide phone/address/zip on dashboard later, we can blank them here.
+    return {
+        "customer_id": legacy.get("customer_id"),
+        "customer_name": m.get("customer_name") or "—",
+        "phone_number": m.get("phone_number") or "",
+        "email": legacy.get("email") or "",
+        "address": legacy.get("address") or "",
+        "zip_code": legacy.get("zip_code") or "",
+        "vehicle_nickname": m.get("vehicle_nickname") or "",
+        "vin_number": m.get("vin") or vin,
+        "make": m.get("make") or "",
+        "model": m.get("model") or "",
+        "year": m.get("year") or "",
+        "status": m.get("status") or "",
+        "notes": m.get("notes") or "",
+        "service_history_link": m.get("service_history_link") or "",
+        "service_history": m.get("service_history") or [],
+        "access_token": (data["veh"] or {}).get("access_token"),
+        "customer_portal_url": f"{request.host_url.rstrip('/')}/vin/{vin}",
+    }
+
 @app.route("/search", methods=["GET"])
 def search():
     vin = normalize_vin(request.args.get("vin"))
-    if len(vin) != 17:
-        return jsonify({"error": "VIN must be 17 characters."}), 400
+    if not is_valid_vin(vin):
+        error = "VIN must be 17 characters." if len(vin) != 17 else "Invalid VIN."
+        # Let proxies absorb repeated junk lookups
+        return jsonify({"error": error}), 400, {"Cache-Control": "public, max-age=60"}
 
     if not supabase_ready():
         return jsonify({"error": "Supabase not configured on server."}), 500
@@ -418,35 +993,49 @@ def search():
         if not data:
             return jsonify({"error": "Vin not found."}), 404
 
-        m = data["merged"]
-        legacy = data["legacy"]
-
-        # Dashboard should populate like your original (includes customer fields + drive gallery)
-        # If you want to hide phone/address/zip on dashboard later, we can blank them here.
-        payload = {
-            "customer_id": legacy.get("customer_id"),
-            "customer_name": m.get("customer_name") or "—",
-            "phone_number": m.get("phone_number") or "",
-            "email": legacy.get("email") or "",
-            "address": legacy.get("address") or "",
-            "zip_code": legacy.get("zip_code") or "",
-            "vehicle_nickname": m.get("vehicle_nickname") or "",
-            "vin_number": m.get("vin") or vin,
-            "make": m.get("make") or "",
-            "model": m.get("model") or "",
-            "year": m.get("year") or "",
-            "status": m.get("status") or "",
-            "notes": m.get("notes") or "",
-            "service_history_link": m.get("service_history_link") or "",
-            "service_history": m.get("service_history") or [],
-            "access_token": (data["veh"] or {}).get("access_token"),
-            "customer_portal_url": f"{request.host_url.rstrip('/')}/vin/{vin}",
-        }
-        return jsonify(payload)
+        payload = search_payload(vin, data)
+        etag = payload_etag(payload)
+        cached = not_modified(etag, SEARCH_CACHE_CONTROL)
+        if cached is not None:
+            return cached
+        return with_cache_headers(jsonify(payload), etag, SEARCH_CACHE_CONTROL)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+MAX_BATCH_VINS = 200
+
+@app.route("/vins", methods=["POST"])
+def batch_search():
+    """
+    Body: {"vins": [...]} -> {VIN: <same payload as /search> | {"error": ...}}
+    """
+    body = request.get_json(silent=True)
+    vins = body.get("vins") if isinstance(body, dict) else None
+    if not isinstance(vins, list):
+        return jsonify({"error": 'Body must be {"vins": [...]}.'}), 400
 
+    if not supabase_ready():
+        return jsonify({"error": "Supabase not configured on server."}), 500
+
+    # normalize + dedupe, keep caller order
+    wanted = list(dict.fromkeys(normalize_vin(v) for v in vins if isinstance(v, str)))[:MAX_BATCH_VINS]
+
+    try:
+        profiles = merged_profiles_by_vins([v for v in wanted if is_valid_vin(v)])
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    out = {}
+    for vin in wanted:
+        if not is_valid_vin(vin):
+            out[vin] = {"error": "Invalid VIN."}
+        elif not profiles.get(vin):
+            out[vin] = {"error": "Vin not found."}
+        else:
+            out[vin] = search_payload(vin, profiles[vin])
+    return jsonify(out)
+
 @app.route("/vin/<value>")
 def public_report(value):
     """
@@ -460,6 +1049,13 @@ def public_report(value):
     if len(value) == 17:
         vin = normalize_vin(value)
 
+        if not is_valid_vin(vin):
+            return (
+                render_template("public_report.html", not_found=True, vin=vin),
+                400,
+                {"Cache-Control": "public, max-age=60"},
+            )
+
         if not supabase_ready():
             return render_template("public_report.html", not_found=True, vin=vin), 500
 
@@ -491,15 +1087,24 @@ def public_report(value):
             }
 
             embed_url = drive_embed_from_folder(m.get("service_history_link") or "")
+            service_history = m.get("service_history") or []
 
-            return render_template(
+            etag = payload_etag([vin, vehicle_for_template, service_history, embed_url])
+            cached = not_modified(etag, PUBLIC_REPORT_CACHE_CONTROL)
+            if cached is not None:
+                return cached
+
+            # Rendered in full, not streamed, so a template error still lands
+            # in the except below; repeat views already short-circuit on 304.
+            html = render_template(
                 "public_report.html",
                 not_found=False,
                 vin=vin,
                 vehicle=vehicle_for_template,
-                service_history=m.get("service_history") or [],
+                service_history=service_history,
                 embed_url=embed_url
             )
+            return with_cache_headers(app.response_class(html), etag, PUBLIC_REPORT_CACHE_CONTROL)
         except Exception:
             return render_template("public_report.html", not_found=True, vin=vin), 500
 
@@ -519,15 +1124,18 @@ def public_report(value):
     history = get_service_history_for_vin_sqlite(vin)
     embed_url = drive_embed_from_folder(vehicle.get("service_history_link"))
 
-    return render_template(
+    return app.response_class(stream_template(
         "public_report.html",
         not_found=False,
         vin=vin,
         vehicle=vehicle,
         service_history=history,
         embed_url=embed_url
-    )
+    ))
 
 if __name__ == "__main__":
+    # Local dev server only; production runs gunicorn (see Procfile).
+    # Debug/reloader is opt-in via FLASK_DEBUG=1.
     port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    debug = os.environ.get("FLASK_DEBUG", "").strip() == "1"
+    app.run(host="0.0.0.0", port=port, debug=debug, threaded=True)
@@ -1,7 +1,8 @@
 import sqlite3, sys, pathlib
+from database import BASE_DIR, DB_PATH as _DB_PATH, get_conn
 
-DB_PATH = pathlib.Path("Customer_Data.db")
-SQL_PATH = pathlib.Path("migrate_tokens.sql")
+DB_PATH = pathlib.Path(_DB_PATH)
+SQL_PATH = pathlib.Path(BASE_DIR) / "migrate_tokens.sql"
 
 if not DB_PATH.exists():
     print(f"ERROR: {DB_PATH} not found in {DB_PATH.resolve().parent}")
@@ -9,7 +10,7 @@ if not DB_PATH.exists():
 
 sql = SQL_PATH.read_text(encoding="utf-8")
 
-con = sqlite3.connect(str(DB_PATH))
+con = get_conn(str(DB_PATH))
 cur = con.cursor()
 
 for stmt in [s.strip() for s in sql.split(";") if s.strip()]:
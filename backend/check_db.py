@@ -1,6 +1,6 @@
-import sqlite3
+from database import get_conn
 
-conn = sqlite3.connect("Customer_Data.db")
+conn = get_conn()
 cursor = conn.cursor()
 
 cursor.execute("SELECT * FROM Customer_Data LIMIT 5")
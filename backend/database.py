@@ -0,0 +1,22 @@
+import os
+import sqlite3
+
+# Shared by app.py and the maintenance scripts so they all open the same
+# file with the same tuning, whatever directory they're run from.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(BASE_DIR, "Customer_Data.db")
+
+def get_conn(path=DB_PATH, **kwargs):
+    """
+    sqlite3.connect() plus the PRAGMAs every connection should run with.
+    Extra kwargs go straight to sqlite3.connect (e.g. isolation_level=None
+    for the app's autocommit reads).
+    """
+    kwargs.setdefault("cached_statements", 256)
+    con = sqlite3.connect(path, **kwargs)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("PRAGMA cache_size=-65536")
+    con.execute("PRAGMA temp_store=MEMORY")
+    con.execute("PRAGMA mmap_size=268435456")
+    return con
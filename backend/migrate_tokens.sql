@@ -0,0 +1,11 @@
+-- Per-vehicle access tokens for the public /vin/<token> report
+ALTER TABLE Customer_Data ADD COLUMN access_token TEXT;
+
+-- Lookup indexes. The expressions must match the WHERE clauses in app.py
+-- (UPPER(TRIM(vin)) / LOWER(TRIM(token))) or SQLite won't use them.
+CREATE INDEX IF NOT EXISTS idx_customer_vin_upper ON Customer_Data(UPPER(TRIM(vin_number)));
+CREATE INDEX IF NOT EXISTS idx_customer_token_lower ON Customer_Data(LOWER(TRIM(access_token)));
+CREATE INDEX IF NOT EXISTS idx_service_vin_upper_date ON Service_History(UPPER(TRIM(vehicle_vin)), date DESC);
+
+-- Refresh planner statistics for the new indexes
+ANALYZE;
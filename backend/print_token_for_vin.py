@@ -1,11 +1,12 @@
-import sqlite3, sys
+import sys
+from database import get_conn
 
 vin = (sys.argv[1] if len(sys.argv) > 1 else "").strip().upper()
 if len(vin) != 17:
     print("Usage: python print_token_for_vin.py <17-char VIN>")
     sys.exit(1)
 
-con = sqlite3.connect("Customer_Data.db")
+con = get_conn()
 cur = con.cursor()
 cur.execute("""
     SELECT access_token
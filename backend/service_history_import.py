@@ -1,18 +1,18 @@
-import sqlite3
 import csv
 import os
+from database import BASE_DIR, DB_PATH, get_conn
 
 # Base paths
-BASE_DIR = os.path.dirname(__file__)
-DB_PATH = os.path.join(BASE_DIR, "Customer_Data.db")
 CSV_PATH = os.path.join(BASE_DIR, "db", "Service_History.csv")
 
 print("Using DB:", DB_PATH)
 print("Using CSV:", CSV_PATH)
 
 # Connect to the main DB (same one used for Customer_Data)
-conn = sqlite3.connect(DB_PATH)
+conn = get_conn(DB_PATH)
 cursor = conn.cursor()
+# Import-only connection: no fsyncs before the final commit.
+cursor.execute("PRAGMA synchronous=OFF")
 
 # Create Service_History table
 cursor.execute("""
@@ -34,38 +34,45 @@ CREATE TABLE IF NOT EXISTS Service_History (
 # Clear any old data (optional, but good while you're iterating)
 cursor.execute("DELETE FROM Service_History")
 
-# Load CSV
-with open(CSV_PATH, newline="", encoding="utf-8") as csvfile:
-    reader = csv.DictReader(csvfile)
-    rows = list(reader)
+# CSV header -> Service_History column, in INSERT order
+CSV_COLUMNS = (
+    ("Date", "date"),
+    ("Customer Name", "customer_name"),
+    ("Vehicle VIN", "vehicle_vin"),
+    ("Service Type", "service_type"),
+    ("Service Notes", "service_notes"),
+    ("Next Recommended Service", "next_recommended_service"),
+    ("Photos Link", "photos_link"),
+    ("Technician", "technician"),
+    ("Price", "price"),
+    ("Customer Feedback", "customer_feedback"),
+)
+
+INSERT_SQL = (
+    f"INSERT INTO Service_History ({', '.join(col for _, col in CSV_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in CSV_COLUMNS)})"
+)
+
+def clean_rows(reader):
+    """
+    Yield one stripped tuple per CSV row. Header positions are resolved once,
+    so each row is plain list indexing (no per-row dict like DictReader);
+    missing columns and short rows become "". Empty lines (csv.reader yields
+    []) are skipped, as DictReader did; rows of bare commas still import.
+    """
+    header = [h.strip() for h in next(reader, [])]
+    positions = [header.index(name) if name in header else None for name, _ in CSV_COLUMNS]
+    for row in reader:
+        if not row:
+            continue
+        yield tuple(
+            row[i].strip() if i is not None and i < len(row) else ""
+            for i in positions
+        )
 
-    for row in rows:
-        cursor.execute("""
-            INSERT INTO Service_History (
-                date,
-                customer_name,
-                vehicle_vin,
-                service_type,
-                service_notes,
-                next_recommended_service,
-                photos_link,
-                technician,
-                price,
-                customer_feedback
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            (row.get("Date") or "").strip(),
-            (row.get("Customer Name") or "").strip(),
-            (row.get("Vehicle VIN") or "").strip(),
-            (row.get("Service Type") or "").strip(),
-            (row.get("Service Notes") or "").strip(),
-            (row.get("Next Recommended Service") or "").strip(),
-            (row.get("Photos Link") or "").strip(),
-            (row.get("Technician") or "").strip(),
-            (row.get("Price") or "").strip(),
-            (row.get("Customer Feedback") or "").strip(),
-        ))
+# Load CSV (streamed straight into executemany, never held in memory)
+with open(CSV_PATH, newline="", encoding="utf-8") as csvfile:
+    cursor.executemany(INSERT_SQL, clean_rows(csv.reader(csvfile)))
 
 conn.commit()
 conn.close()